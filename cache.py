@@ -1,13 +1,35 @@
-import json
+import asyncio
+import functools
 import hashlib
+import os
+import sqlite3
+import threading
 import time
 from pathlib import Path
-from typing import Optional, Dict, Any, List
-from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List, Tuple
 import logging
 
+import orjson
+import zstandard
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
 logger = logging.getLogger(__name__)
 
+# Transcript JSON is repetitive text, so entries are stored zstd-compressed
+_ZSTD_LEVEL = 3
+
+@functools.lru_cache(maxsize=1024)
+def _get_cache_key(video_id: str) -> str:
+    """Generate cache key from video ID"""
+    # Keys only need to be well distributed, not cryptographic
+    if xxhash is not None:
+        return xxhash.xxh3_64_hexdigest(video_id.encode())
+    return hashlib.md5(video_id.encode()).hexdigest()
+
 class TranscriptionCache:
     """Cache system for YouTube transcripts"""
 
@@ -19,143 +41,255 @@ class TranscriptionCache:
     ):
         self.cache_dir = Path(cache_dir)
         self.cache_dir.mkdir(exist_ok=True) 
-        self.max_age = timedelta(hours=max_age_hours)
+        self._max_age_s = max_age_hours * 3600  # Convert to seconds
         self.max_cache_size = max_cache_size_mb * 1024 * 1024  # Convert to bytes
 
-        # Create metadata file if it doesn't exist
-        self.metadata_file = self.cache_dir / "cache_metadata.json"
-        if not self.metadata_file.exists():
-            self._save_metadata({})
+        # Caches from before the SQLite store keep metadata in cache_metadata.json
+        # next to uncompressed {md5}.json entries. Entries are cheap to refetch,
+        # so the old layout is removed once rather than migrated
+        legacy_metadata_file = self.cache_dir / "cache_metadata.json"
+        if legacy_metadata_file.exists():
+            for cache_file in self.cache_dir.glob("*.json"):
+                cache_file.unlink(missing_ok=True)
+            logger.info("Removed cache entries in the legacy JSON layout")
+
+        # Metadata lives in SQLite so lookups and eviction are index probes
+        # instead of a full JSON rewrite on every operation
+        self.metadata_file = self.cache_dir / "metadata.db"
+        # The connection is shared with set_async's worker threads, guarded by _lock
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.metadata_file, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "cache_key TEXT PRIMARY KEY, video_id TEXT, ts REAL, size INTEGER, "
+                "atime REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_atime ON entries(atime)")
+            # Recent fetch failures, so retries in a session fail fast
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS failures ("
+                "cache_key TEXT PRIMARY KEY, video_id TEXT, expiry REAL, error TEXT)"
+            )
 
-    def _get_cache_key(self, video_id: str) -> str:
-        """Generate cache key from video ID"""
-        return hashlib.md5(video_id.encode()).hexdigest()
+    def _get_cache_paths(self, cache_key: str) -> Tuple[Path, Path]:
+        """Get the metadata and segments file paths for a cache key"""
+        return (
+            self.cache_dir / f"{cache_key}.meta.json.zst",
+            self.cache_dir / f"{cache_key}.segs.json.zst"
+        )
 
-    def _get_cache_path(self, video_id: str) -> Path:
-        """Get the cache file path for a video ID"""
-        cache_key = self._get_cache_key(video_id)
-        return self.cache_dir / f"{cache_key}.json"
+    def _write_atomic(self, path: Path, payload: bytes) -> bool:
+        """
+        Write to a temp file and rename it into place so readers never see a partial file.
 
-    def _load_metadata(self) -> Dict[str, Any]:
-        """Load cache metadata"""
+        Returns False if the temp file was removed before the rename, e.g. by a
+        concurrent clear().
+        """
+        # Unique per process and thread, since writes happen outside the lock
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(payload)
         try:
-            with open(self.metadata_file, 'r') as f:
-                return json.load(f)
-        except:
-            return {}
+            tmp_path.replace(path)
+        except FileNotFoundError:
+            logger.debug(f"Dropped cache write to {path.name}, temp file was removed")
+            return False
+        return True
 
-    def _save_metadata(self, metadata: Dict[str, Any]):
-        """Save cache metadata"""
-        with open(self.metadata_file, 'w') as f:
-            json.dump(metadata, f, indent=2)
+    def get(self, video_id: str, with_segments: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Get transcript from cache if it exists and is valid.
 
-    def get(self, video_id: str) -> Optional[Dict[str, Any]]:
-        """Get transcript from cache if it exists and is valid"""
-        cache_path = self._get_cache_path(video_id)
+        Segments are stored separately from the full transcript and are only
+        read when with_segments is True.
+        """
+        cache_key = _get_cache_key(video_id)
+        meta_path, segs_path = self._get_cache_paths(cache_key)
         
-        if not cache_path.exists():
+        if not meta_path.exists():
             logger.debug(f"Cache miss for video {video_id}")
             return None
         
         # Check age
-        metadata = self._load_metadata()
-        cache_key = self._get_cache_key(video_id)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT ts FROM entries WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
         
-        if cache_key in metadata:
-            cached_time = datetime.fromisoformat(metadata[cache_key]['timestamp'])
-            if datetime.now() - cached_time > self.max_age:
+        if row is not None:
+            if time.time() - row[0] > self._max_age_s:
                 logger.debug(f"Cache expired for video {video_id}")
                 self.delete(video_id)
                 return None
         
         # Load and return cached data
         try:
-            with open(cache_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                logger.debug(f"Cache hit for video {video_id}")
-                return data
+            decompressor = zstandard.ZstdDecompressor()
+            data = orjson.loads(decompressor.decompress(meta_path.read_bytes()))
+            if with_segments:
+                data['transcript_segments'] = orjson.loads(
+                    decompressor.decompress(segs_path.read_bytes())
+                )
         except Exception as e:
             logger.error(f"Error reading cache for {video_id}: {e}")
             self.delete(video_id)
             return None
+        
+        # Record the access so eviction is least-recently-used
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE entries SET atime = ? WHERE cache_key = ?",
+                (time.time(), cache_key)
+            )
+        logger.debug(f"Cache hit for video {video_id}")
+        return data
     
     def set(self, video_id: str, data: Dict[str, Any]):
         """Save transcript to cache"""
-        cache_path = self._get_cache_path(video_id)
-        cache_key = self._get_cache_key(video_id)
+        cache_key = _get_cache_key(video_id)
+        meta_path, segs_path = self._get_cache_paths(cache_key)
         
-        # Save transcript data
-        with open(cache_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        # Save transcript data, encoded in memory and written in one call per
+        # file. Segments go to their own file so the common read path skips them.
+        # This runs outside the lock so a large write doesn't stall other callers
+        compressor = zstandard.ZstdCompressor(level=_ZSTD_LEVEL)
+        meta = {k: v for k, v in data.items() if k != 'transcript_segments'}
+        meta_payload = compressor.compress(orjson.dumps(meta))
+        segs_payload = compressor.compress(orjson.dumps(data.get('transcript_segments')))
+        if not self._write_atomic(segs_path, segs_payload):
+            return
+        if not self._write_atomic(meta_path, meta_payload):
+            segs_path.unlink(missing_ok=True)
+            return
+        size = len(meta_payload) + len(segs_payload)
         
         # Update metadata
-        metadata = self._load_metadata()
-        metadata[cache_key] = {
-            'video_id': video_id,
-            'timestamp': datetime.now().isoformat(),
-            'size': cache_path.stat().st_size
-        }
-        self._save_metadata(metadata)
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries (cache_key, video_id, ts, size, atime) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (cache_key, video_id, now, size, now)
+                )
+                # A successful fetch supersedes any recorded failure
+                self._conn.execute("DELETE FROM failures WHERE cache_key = ?", (cache_key,))
         
-        logger.debug(f"Cached transcript for video {video_id}")
+            logger.debug(f"Cached transcript for video {video_id}")
         
-        # Clean up if cache is too large
-        self._cleanup_if_needed()
+            # Clean up if cache is too large
+            self._cleanup_if_needed()
+    
+    def get_negative(self, video_id: str) -> Optional[str]:
+        """Get the error of a recent failed fetch, if one hasn't expired yet"""
+        with self._lock:
+            cache_key = _get_cache_key(video_id)
+            row = self._conn.execute(
+                "SELECT expiry, error FROM failures WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+        
+            if row is None:
+                return None
+        
+            expiry, error = row
+            if time.time() > expiry:
+                with self._conn:
+                    self._conn.execute("DELETE FROM failures WHERE cache_key = ?", (cache_key,))
+                return None
+        
+            logger.debug(f"Negative cache hit for video {video_id}")
+            return error
+    
+    def set_negative(self, video_id: str, error: str, ttl: int = 300):
+        """Remember a failed fetch for ttl seconds"""
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                # Prune expired rows here, since the table persists across sessions
+                self._conn.execute("DELETE FROM failures WHERE expiry < ?", (now,))
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO failures (cache_key, video_id, expiry, error) "
+                    "VALUES (?, ?, ?, ?)",
+                    (_get_cache_key(video_id), video_id, now + ttl, error)
+                )
+            logger.debug(f"Cached fetch failure for video {video_id}")
+    
+    async def set_async(self, video_id: str, data: Dict[str, Any]):
+        """Save transcript to cache without blocking the event loop"""
+        await asyncio.to_thread(self.set, video_id, data)
     
     def delete(self, video_id: str):
         """Delete a specific video from cache"""
-        cache_path = self._get_cache_path(video_id)
-        cache_key = self._get_cache_key(video_id)
-        
-        if cache_path.exists():
-            cache_path.unlink()
+        with self._lock:
+            self._delete_key(_get_cache_key(video_id))
+    
+    def _delete_key(self, cache_key: str):
+        """Delete the files and metadata stored under a cache key"""
+        # Another server process sharing the cache may have removed them already
+        for cache_path in self._get_cache_paths(cache_key):
+            cache_path.unlink(missing_ok=True)
         
-        metadata = self._load_metadata()
-        if cache_key in metadata:
-            del metadata[cache_key]
-            self._save_metadata(metadata)
+        with self._conn:
+            self._conn.execute("DELETE FROM entries WHERE cache_key = ?", (cache_key,))
     
     def clear(self):
         """Clear entire cache"""
-        for cache_file in self.cache_dir.glob("*.json"):
-            if cache_file != self.metadata_file:
-                cache_file.unlink()
+        with self._lock:
+            # *.tmp also catches any write interrupted before its rename
+            for pattern in ("*.json.zst", "*.tmp"):
+                for cache_file in self.cache_dir.glob(pattern):
+                    # A concurrent write may rename or drop its temp file meanwhile
+                    cache_file.unlink(missing_ok=True)
         
-        self._save_metadata({})
-        logger.info("Cache cleared")
+            with self._conn:
+                self._conn.execute("DELETE FROM entries")
+                self._conn.execute("DELETE FROM failures")
+            logger.info("Cache cleared")
     
     def _cleanup_if_needed(self):
-        """Remove old entries if cache is too large"""
-        metadata = self._load_metadata()
-        
-        # Calculate total size
-        total_size = sum(entry['size'] for entry in metadata.values())
+        """Remove least recently used entries if cache is too large"""
+        # Read the total from the database, which other server processes
+        # sharing this cache directory also write to
+        total_size = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()[0]
         
         if total_size > self.max_cache_size:
-            # Sort by timestamp (oldest first)
-            sorted_entries = sorted(
-                metadata.items(),
-                key=lambda x: x[1]['timestamp']
+            # Walk the access time index (least recently used first) until
+            # enough space is freed
+            victims = []
+            rows = self._conn.execute(
+                "SELECT cache_key, video_id, size FROM entries ORDER BY atime ASC"
             )
+            for cache_key, video_id, size in rows:
+                if total_size <= self.max_cache_size:
+                    break
+                victims.append((cache_key, video_id))
+                total_size -= size
             
-            # Remove oldest entries until under size limit
-            while total_size > self.max_cache_size and sorted_entries:
-                cache_key, entry = sorted_entries.pop(0)
-                video_id = entry['video_id']
-                self.delete(video_id)
-                total_size -= entry['size']
+            # Remove least recently used entries until under size limit
+            for cache_key, video_id in victims:
+                self._delete_key(cache_key)
                 logger.debug(f"Removed {video_id} from cache to free space")
     
     def get_stats(self) -> Dict[str, Any]:
         """Get cache statistics"""
-        metadata = self._load_metadata()
-        
-        total_size = sum(entry['size'] for entry in metadata.values())
+        with self._lock:
+            total_videos, total_size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
         
         return {
-            'total_videos': len(metadata),
+            'total_videos': total_videos,
             'total_size_mb': round(total_size / (1024 * 1024), 2),
             'max_size_mb': self.max_cache_size / (1024 * 1024),
             'cache_dir': str(self.cache_dir),
-            'max_age_hours': self.max_age.total_seconds() / 3600
-        }
\ No newline at end of file
+            'max_age_hours': self._max_age_s / 3600
+        }
+    
+    def close(self):
+        """Close the metadata database connection"""
+        with self._lock:
+            self._conn.close()
@@ -5,10 +5,14 @@ import requests
 from youtube_transcript_api import YouTubeTranscriptApi
 import time
 
+# Reuse one session so every request below shares TCP/TLS connections
+session = requests.Session()
+ytt_api = YouTubeTranscriptApi(http_client=session)
+
 # Test basic YouTube connectivity
 print("1. Testing basic YouTube connectivity...")
 try:
-    response = requests.get("https://www.youtube.com", timeout=10)
+    response = session.get("https://www.youtube.com", timeout=10)
     print(f"   ✓ YouTube.com responded with status {response.status_code}")
 except Exception as e:
     print(f"   ✗ Failed to reach YouTube: {e}")
@@ -28,7 +32,7 @@ for video_id, title in test_videos:
         time.sleep(1)
         
         # Try to get available transcripts
-        transcript_list = YouTubeTranscriptApi.list_transcripts(video_id)
+        transcript_list = ytt_api.list(video_id)
         available = []
         for t in transcript_list:
             available.append(f"{t.language} ({'auto' if t.is_generated else 'manual'})")
@@ -36,7 +40,7 @@ for video_id, title in test_videos:
         print(f"   ✓ Available transcripts: {', '.join(available)}")
         
         # Try to fetch the first one
-        transcript = YouTubeTranscriptApi.get_transcript(video_id)
+        transcript = ytt_api.fetch(video_id)
         print(f"   ✓ Successfully fetched {len(transcript)} segments")
         
     except Exception as e:
@@ -55,7 +59,7 @@ try:
     headers = {
         'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
     }
-    response = requests.get(url, headers=headers, timeout=10)
+    response = session.get(url, headers=headers, timeout=10)
     print(f"   ✓ YouTube video page responded with status {response.status_code}")
     if "captcha" in response.text.lower():
         print("   ⚠️  YouTube is showing a CAPTCHA - this indicates bot detection")
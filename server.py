@@ -2,14 +2,16 @@ from mcp.server import Server
 from mcp.server.stdio import stdio_server
 from mcp.types import Tool, TextContent
 from youtube_transcript_api import YouTubeTranscriptApi
+import requests
 from cache import TranscriptionCache
 import asyncio
+import functools
 import sys
 import re
 import time
 import logging
+from pathlib import Path
 from typing import Any, Dict, Text
-import random
 
 # Configure logging to stderr
 logging.basicConfig(
@@ -21,43 +23,95 @@ logging.basicConfig(
 # Create server instance
 server = Server("youtube-summarizer")
 
-# Initialize cache lazily
-cache = None
+# Share one HTTP session across YouTube requests so connections are reused
+http_session = requests.Session()
+ytt_api = YouTubeTranscriptApi(http_client=http_session)
 
-def get_cache():
-    global cache
-    if cache is None:
-        # Use a cache directory in the user's home directory
-        from pathlib import Path
-        cache_dir = Path.home() / ".youtube_mcp_cache"
-        cache = TranscriptionCache(cache_dir=str(cache_dir))
-    return cache
+class TokenBucket:
+    """Rate limiter that lets short bursts through and throttles sustained load"""
+
+    def __init__(self, rate: float = 1.0, burst: int = 3):
+        self.rate = rate  # Tokens added per second
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last_fill = time.monotonic()
+
+    async def acquire(self):
+        """Take a token, waiting for one to refill if the bucket is empty"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last_fill) * self.rate)
+        self.last_fill = now
+
+        # Take the token up front, going negative if needed, so concurrent
+        # callers queue behind each other instead of all waking at once
+        self.tokens -= 1
+        if self.tokens < 0:
+            delay = -self.tokens / self.rate
+            logging.info(f"Rate limiting, waiting {delay:.1f}s before YouTube API call...")
+            await asyncio.sleep(delay)
+
+# Throttle YouTube requests to avoid rate limiting
+rate_limiter = TokenBucket(rate=1.0, burst=3)
+
+# Initialize cache lazily, once per process
+@functools.cache
+def get_cache() -> TranscriptionCache:
+    # Use a cache directory in the user's home directory
+    cache_dir = Path.home() / ".youtube_mcp_cache"
+    return TranscriptionCache(cache_dir=str(cache_dir))
+
+# Matches watch URLs (v= anywhere in the query string) and youtu.be short links
+# https://gist.github.com/rodrigoborgesdeoliveira/987683cfbfcc8d800192da1e73adc486
+_VIDEO_ID_RE = re.compile(r'(?:youtube\.com\/watch\?(?:.*&)?v=|youtu\.be\/)([^&\s]+)')
 
 # Helper function to extract YouTube video Id
 def extract_video_id(url: str) -> str:
     """Extract video ID from various YouTube URL formats"""
-    # https://gist.github.com/rodrigoborgesdeoliveira/987683cfbfcc8d800192da1e73adc486
-    patterns = [
-        r'(?:youtube\.com\/watch\?v=|youtu\.be\/)([^&\s]+)',
-        r'youtube\.com\/watch\?.*v=([^&\s]+)'
-    ]
-
-    for pattern in patterns:
-        match = re.search(pattern, url)
-        if match:
-            return match.group(1)
+    match = _VIDEO_ID_RE.search(url)
+    if match:
+        return match.group(1)
 
     raise ValueError("Could not extract video ID from URL")
 
 
-def get_transcript_with_cache(video_id: str) -> str:
+# Helper function to build the transcript data dict shared by cache and no-cache paths
+def build_transcript_data(video_id: str, transcript_list: list) -> Dict[str, Any]:
+    """Compute full text and duration from transcript segments"""
+    if transcript_list:
+        last_segment = transcript_list[-1]
+        duration_seconds = last_segment['start'] + last_segment['duration']
+        duration_minutes = int(duration_seconds / 60)
+        
+        # Combine all transcript segments into full text
+        full_transcript = ' '.join([segment['text'] for segment in transcript_list])
+    else:
+        duration_seconds = 0
+        duration_minutes = 0
+        full_transcript = ""
+
+    return {
+        'video_id': video_id,
+        'transcript_segments': transcript_list,
+        'full_transcript': full_transcript,
+        'duration_seconds': duration_seconds,
+        'duration_minutes': duration_minutes,
+        'fetched_at': time.time()
+    }
+
+
+async def get_transcript_with_cache(video_id: str, with_segments: bool = False) -> Dict[str, Any]:
     """Get transcript with caching"""
 
-    cached_data = get_cache().get(video_id)
+    cached_data = get_cache().get(video_id, with_segments=with_segments)
     if cached_data:
         logging.info(f"Cache hit for video {video_id}")
         return cached_data
 
+    # Fail fast if this video failed recently instead of hitting YouTube again
+    cached_error = get_cache().get_negative(video_id)
+    if cached_error:
+        raise Exception(cached_error)
+
     # Fetch from YouTube
     logging.info(f"Fetching transcript for video {video_id} from YouTube")
     
@@ -66,14 +120,12 @@ def get_transcript_with_cache(video_id: str) -> str:
         transcript_list = None
         error_msg = None
         
-        # Add a small random delay to avoid rate limiting
-        delay = random.uniform(0.5, 1.5)
-        logging.info(f"Waiting {delay:.1f}s before YouTube API call...")
-        time.sleep(delay)
+        # Only bursts of requests wait here; the first call after a quiet period doesn't
+        await rate_limiter.acquire()
         
         try:
             # First try to get any available transcript
-            transcript_list = YouTubeTranscriptApi.get_transcript(video_id)
+            transcript_list = ytt_api.fetch(video_id).to_raw_data()
         except Exception as e:
             error_msg = str(e)
             logging.warning(f"Failed to get default transcript: {error_msg}")
@@ -81,14 +133,14 @@ def get_transcript_with_cache(video_id: str) -> str:
             # If rate limited, wait longer and retry
             if "429" in str(e) or "no element found" in str(e):
                 logging.info("Possible rate limiting detected, waiting 5 seconds...")
-                time.sleep(5)
+                await asyncio.sleep(5)
             
             # Try to list available transcripts and get the first one
             try:
-                transcript_info = YouTubeTranscriptApi.list_transcripts(video_id)
+                transcript_info = ytt_api.list(video_id)
                 for transcript in transcript_info:
                     try:
-                        transcript_list = transcript.fetch()
+                        transcript_list = transcript.fetch().to_raw_data()
                         logging.info(f"Successfully fetched transcript in language: {transcript.language}")
                         break
                     except:
@@ -98,37 +150,24 @@ def get_transcript_with_cache(video_id: str) -> str:
         
         if transcript_list is None:
             if "no element found" in str(error_msg):
-                raise Exception(f"YouTube returned empty response. The video may not have captions available, may be private, or YouTube may be temporarily blocking requests. Video ID: {video_id}")
+                error = f"YouTube returned empty response. The video may not have captions available, may be private, or YouTube may be temporarily blocking requests. Video ID: {video_id}"
             else:
-                raise Exception(f"Could not retrieve transcript: {error_msg}")
+                error = f"Could not retrieve transcript: {error_msg}"
+            get_cache().set_negative(video_id, error)
+            raise Exception(error)
                 
     except Exception as e:
         logging.error(f"YouTube API error: {str(e)}")
         raise
-    if transcript_list:
-        last_segment = transcript_list[-1]
-        duration_seconds = last_segment['start'] + last_segment['duration']
-        duration_minutes = int(duration_seconds / 60)
-        
-        # Combine all transcript segments into full text
-        full_transcript = ' '.join([segment['text'] for segment in transcript_list])
-    else:
-        duration_seconds = 0
-        duration_minutes = 0
-        full_transcript = ""
 
-    # Prepare Data
-    data = {
-        'video_id': video_id,
-        'transcript_segments': transcript_list,
-        'full_transcript': full_transcript,
-        'duration_seconds': duration_seconds,
-        'duration_minutes': duration_minutes,
-        'fetched_at': time.time()
-    }
+    data = build_transcript_data(video_id, transcript_list)
 
-    # Cache the data
-    get_cache().set(video_id, data)
+    # Cache the data off the event loop
+    await get_cache().set_async(video_id, data)
+
+    # Match the shape of a cache hit, which only includes segments on request
+    if not with_segments:
+        data = {k: v for k, v in data.items() if k != 'transcript_segments'}
     return data
 
 # Define available tools
@@ -180,23 +219,11 @@ async def call_tool(name: str, arguments: Dict[str, Any]) -> list[TextContent]:
                 )]
             
             if use_cache:
-                data = get_transcript_with_cache(video_id)
+                data = await get_transcript_with_cache(video_id, with_segments=False)
             else:
                 # Force fresh fetch
-                transcript_list = YouTubeTranscriptApi.get_transcript(video_id)
-                full_transcript = " ".join([entry['text'] for entry in transcript_list])
-                
-                if transcript_list:
-                    last_segment = transcript_list[-1]
-                    duration_seconds = last_segment['start'] + last_segment['duration']
-                    duration_minutes = int(duration_seconds / 60)
-                else:
-                    duration_minutes = 0
-                
-                data = {
-                    'full_transcript': full_transcript,
-                    'duration_minutes': duration_minutes
-                }
+                transcript_list = ytt_api.fetch(video_id).to_raw_data()
+                data = build_transcript_data(video_id, transcript_list)
             
             response = f"Video duration: {data['duration_minutes']} minutes\n\n{data['full_transcript']}"
             